@@ -1,60 +1,203 @@
-from datetime import datetime
-import base64
+import threading
+import time
+import uuid
 from collections import deque
+from functools import lru_cache
+import numpy as np
 import requests
-import pandas as pd
+from requests.adapters import HTTPAdapter
 import pycountry
-from dash import Dash, dcc, html, Input, Output, State
+from dash import Dash, dcc, html, Input, Output, State, Patch
 from dash.exceptions import PreventUpdate
 import plotly.graph_objects as go
 
-# --- Environment Setup (Cleaned) ---
-# Load Santa face image:
-# Ensure 'santa_face_400pct.png' is in the same directory as this script.
-encoded_image = ""
-try:
-    with open("santa_face_400pct.png", "rb") as f:
-        encoded_image = base64.b64encode(f.read()).decode()
-except FileNotFoundError:
-    print("Warning: santa_face_400pct.png not found. Image will not display.")
-
 # Constants:
 ISS_URL = "https://api.wheretheiss.at/v1/satellites/25544"
+COORD_URL = "https://api.wheretheiss.at/v1/coordinates/{lat},{lon}"
+# Santa face image is served by Dash from the assets/ folder next to this script
+SANTA_IMAGE_URL = "/assets/santa_face_400pct.png"
 color_map = {"daylight": "white", "visible": "#FFFF00", "eclipsed": "red"}
+# Visibility strings map to small ints once; colors are then a tuple index.
+# Any unexpected visibility value gets VIS_UNKNOWN (white marker, no track).
+VIS_CODE = {vis: code for code, vis in enumerate(color_map)}
+VIS_UNKNOWN = len(VIS_CODE)
+COLOR_BY_CODE = (*color_map.values(), "#FFFFFF")
 MAX_POINTS = 1080   # Keeps only the most recent 1080 track points (approx. 2 orbits)
-TRACK_LAT = deque(maxlen=MAX_POINTS)
-TRACK_LON = deque(maxlen=MAX_POINTS)
-TRACK_VIS = deque(maxlen=MAX_POINTS)
+POLL_SECONDS = 10   # Upstream polling period, matching the browser interval
+TRACK_DECIMALS = 5  # ~1 m of precision; shorter numbers in the figure JSON
+# Track history: preallocated lat/lon ring buffers (HEAD is the next write
+# slot, FILL the number of valid points) plus run-length visibility segments
+# as [vis_code, count, trace] entries, oldest first, covering the FILL buffered
+# points. Each segment's trace dict is built once when the segment starts.
+LAT_BUF = np.empty(MAX_POINTS, np.float32)
+LON_BUF = np.empty(MAX_POINTS, np.float32)
+HEAD, FILL = 0, 0
+SEGMENTS = deque()
+
+# Latest callback outputs published by the background poller. "seq" counts
+# published ticks and "patch" turns the previous tick's figure into this one.
+# Browsers store [BOOT_ID, seq], so a tick number left over from an earlier
+# server process never matches this one.
+BOOT_ID = uuid.uuid4().hex
+STATE = {"seq": 0, "outputs": None, "patch": None}
+STATE_LOCK = threading.Lock()
+
+# Shared HTTP session so both API calls reuse the same pooled connection.
+# The calls stay synchronous: the coordinates lookup needs the position from
+# the telemetry response, so the two requests cannot be issued concurrently.
+# Both endpoints live on one host, so a single dedicated pool is enough, and
+# retries are off since the next interval tick retries anyway.
+SESSION = requests.Session()
+SESSION.mount("https://api.wheretheiss.at",
+              HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0))
+SESSION.headers.update({"Connection": "keep-alive", "Keep-Alive": "timeout=60"})
 
 # --- Utility Functions ---
 def get_iss_telemetry(url=ISS_URL):
     """Fetches current ISS telemetry data from the API."""
     try:
-        resp = requests.get(url, timeout=10)
+        resp = SESSION.get(url, timeout=10)
         resp.raise_for_status()
-        data = resp.json()
-        df = pd.DataFrame([data])
-        # Drop unnecessary columns
-        df.drop(["id", "footprint", "daynum", "solar_lat", "solar_lon"],
-                errors="ignore", axis=1, inplace=True)
-        return df
+        return resp.json()
     except (requests.Timeout, requests.ConnectionError) as e:
         print(f"⚠️ Network issue: {e}")
     except requests.HTTPError as e:
         print(f"⚠️ API returned {resp.status_code}: {e}")
     return None
 
-def split_segments(df):
-    """Splits the track DataFrame into segments based on visibility type."""
-    if df.empty:
-        return []
-    segments, start = [], 0
-    for i in range(1, len(df)):
-        if df["vis"].iloc[i] != df["vis"].iloc[i-1]:
-            segments.append(df.iloc[start:i])
-            start = i
-    segments.append(df.iloc[start:])
-    return segments
+def reverse_geocode(lat, lon):
+    """Returns the country code under a position from the API.
+
+    Network errors propagate to the caller.
+    """
+    resp = SESSION.get(COORD_URL.format(lat=lat, lon=lon), timeout=6)
+    resp.raise_for_status()
+    return resp.json().get("country_code")
+
+@lru_cache(maxsize=512)
+def country_name_for(code):
+    """Resolves an ISO alpha-2 country code to its name (cached)."""
+    match = pycountry.countries.get(alpha_2=code)
+    return match.name if match else code
+
+def segment_trace(vis_code):
+    """Builds the static part of a track segment's trace (None if unstyled)."""
+    if vis_code == VIS_UNKNOWN:
+        return None
+    return dict(type="scattergeo", mode="lines",
+                line=dict(width=2, color=COLOR_BY_CODE[vis_code]),
+                showlegend=False, geo="geo")
+
+def append_track_point(lat, lon, vis_code):
+    """Appends a point to the track ring buffers, overwriting the oldest.
+
+    Returns (trimmed, started): the segment entry that lost its oldest point
+    (None if the buffer was not full yet; a count of 0 means it was dropped)
+    and whether the new point started a new segment.
+    """
+    global HEAD, FILL
+    LAT_BUF[HEAD] = round(lat, TRACK_DECIMALS)
+    LON_BUF[HEAD] = round(lon, TRACK_DECIMALS)
+    HEAD = (HEAD + 1) % MAX_POINTS
+
+    trimmed = None
+    if FILL == MAX_POINTS:
+        # The overwritten slot held the oldest point of the first segment
+        trimmed = SEGMENTS[0]
+        trimmed[1] -= 1
+        if not trimmed[1]:
+            SEGMENTS.popleft()
+    else:
+        FILL += 1
+
+    started = not SEGMENTS or SEGMENTS[-1][0] != vis_code
+    if started:
+        SEGMENTS.append([vis_code, 1, segment_trace(vis_code)])
+    else:
+        SEGMENTS[-1][1] += 1
+    return trimmed, started
+
+def ordered_track(buf):
+    """Returns the valid points of a track ring buffer, oldest first."""
+    if FILL < MAX_POINTS:
+        return buf[:FILL]
+    return np.roll(buf, -HEAD)
+
+# --- Static Figure Layout ---
+# Validated and serialized once at import; update_map only fills in the
+# changing annotations and the marker positions.
+LEGEND_HTML = (
+    "<b>Visibility</b><br>"
+    f"<span style='color:{color_map['daylight']}'>━━ ●</span> daylight<br>"
+    f"<span style='color:{color_map['visible']}'>━━ ●</span> visible<br>"
+    f"<span style='color:{color_map['eclipsed']}'>━━ ●</span> eclipsed"
+)
+
+BASE_LAYOUT = go.Layout(
+    images=[dict(
+        source=SANTA_IMAGE_URL,
+        xref="paper", yref="paper",
+        x=-0.01, y=0.99,
+        sizex=0.50, sizey=0.50,
+        xanchor="left", yanchor="top",
+        layer="above"
+    )],
+    annotations=[
+        dict(text="<b>Currently over:</b>", x=-0.005, y=0.11,
+             xref="paper", yref="paper", showarrow=False,
+             font=dict(size=24, color="#00ff7f"),
+             bgcolor="rgba(0,0,0,1)", borderpad=1),
+        dict(text="", x=-0.005, y=0.01,
+             xref="paper", yref="paper", showarrow=False,
+             font=dict(size=30, color="red"),
+             bgcolor="rgba(0,0,0,0)", borderpad=6),
+        dict(text="", x=0.5, y=1.03,
+             xref="paper", yref="paper", showarrow=False,
+             font=dict(size=22, color="red")),
+        dict(text=LEGEND_HTML, x=0.99, y=0.98,
+             xref="paper", yref="paper", showarrow=False,
+             align="left", font=dict(size=20, color="springgreen")),
+    ],
+    paper_bgcolor="rgba(0,0,0,0)",
+    plot_bgcolor="black",
+    margin=dict(l=30, r=30, t=40, b=30),
+    geo=dict(
+        domain=dict(x=[0.068,  0.932],  y=[0.068,  0.932]),
+        projection_type="natural earth",
+        showland=True, landcolor="#00ff7f",
+        showcountries=True, countrycolor="darkgreen",
+        showcoastlines=True, coastlinecolor="#00ff7f",
+        bgcolor="black", showframe=True, framecolor="#00ff7f",
+    ),
+    geo2=dict(
+        domain=dict(x=[0.79, 1.0], y=[0.04, 0.28]),
+        showland=True, landcolor="tan",
+        showcountries=False,
+        showcoastlines=True, coastlinecolor="tan",
+        projection_type="orthographic",
+        bgcolor='black',
+        showframe=False
+    )
+).to_plotly_json()
+
+# Current ISS marker (MAIN map)
+SANTA_MARKER = dict(
+    type="scattergeo",
+    mode="text",
+    text=["🎅"],
+    textfont=dict(size=28),   # adjust size as needed
+    showlegend=False,
+    geo="geo"
+)
+
+# Inset globe marker, colored by visibility code like the track
+INSET_MARKER = dict(
+    type="scattergeo",
+    mode="markers",
+    showlegend=False,
+    geo="geo2"
+)
+INSET_MARKER_STYLES = tuple(dict(size=8, color=c) for c in COLOR_BY_CODE)
 
 # --- Dash Application Setup ---
 app = Dash(__name__)
@@ -124,167 +267,170 @@ app.layout = html.Div(
                 "margin": "0 auto",
             },
         ),
-        # dcc.Store is used for maintaining the track history between updates
-        dcc.Store(id="track-store", data={"lat": [], "lon": [], "vis": []}),
+        # Poller tick the browser's figure reflects, so updates can be patches
+        dcc.Store(id="track-seq"),
         # Interval set to 10 seconds (10 * 1000 ms)
-        dcc.Interval(id="interval", interval=10 * 1000, n_intervals=0),
+        dcc.Interval(id="interval", interval=POLL_SECONDS * 1000, n_intervals=0),
     ],
 )
 
-# --- Callback for Updating Map and Readouts ---
-@app.callback(
-    [
-        Output("iss-map", "figure"),
-        Output("lat-box", "children"),
-        Output("lon-box", "children"),
-        Output("alt-box", "children"),
-        Output("vel-box", "children"),
-        Output("track-store", "data"),
-    ],
-    Input("interval", "n_intervals"),
-    State("track-store", "data")
+# --- Clientside Callback for Pausing Updates in Hidden Tabs ---
+# Runs once on page load (the interval's id never changes) and registers a
+# visibilitychange listener that toggles the interval from then on.
+app.clientside_callback(
+    """
+    function(_) {
+        document.addEventListener("visibilitychange", function() {
+            dash_clientside.set_props("interval", {disabled: document.hidden});
+        });
+        return document.hidden;
+    }
+    """,
+    Output("interval", "disabled"),
+    Input("interval", "id"),
 )
-def update_map(_, track_data):
-    """Fetches new data, updates track, and generates the map figure."""
-    df = get_iss_telemetry()
-    if df is None:
-        raise PreventUpdate
 
-    lat = float(df["latitude"].iloc[0])
-    lon = float(df["longitude"].iloc[0])
-    alt = float(df["altitude"].iloc[0])
-    vel = float(df["velocity"].iloc[0])
-    vis = df["visibility"].iloc[0]
-    current_time = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
+# --- Incremental Figure Updates ---
+def track_patch(trimmed, started, traces, annotations):
+    """Builds a Patch that turns the previous tick's figure into this one.
+
+    traces is this tick's trace list: the drawn segments followed by the two
+    position markers. Only the changed points, markers and annotations are
+    sent, instead of the whole track.
+    """
+    patch = Patch()
+    if trimmed is not None and trimmed[2] is not None:
+        # The oldest drawn segment is always the first trace
+        if trimmed[1]:
+            del patch["data"][0]["lat"][0]
+            del patch["data"][0]["lon"][0]
+        else:
+            del patch["data"][0]
+
+    newest = len(traces) - 3
+    if SEGMENTS[-1][2] is not None:
+        if started:
+            patch["data"].insert(newest, traces[newest])
+        else:
+            # Round like the buffers so the point encodes as a short number
+            # rather than the float32 value widened to a double
+            patch["data"][newest]["lat"].append(
+                round(float(traces[newest]["lat"][-1]), TRACK_DECIMALS))
+            patch["data"][newest]["lon"].append(
+                round(float(traces[newest]["lon"][-1]), TRACK_DECIMALS))
+
+    patch["data"][newest + 1] = traces[newest + 1]
+    patch["data"][newest + 2] = traces[newest + 2]
+    patch["layout"]["annotations"][1]["text"] = annotations[1]["text"]
+    patch["layout"]["annotations"][2]["text"] = annotations[2]["text"]
+    return patch
+
+# --- Background Poller ---
+# A single thread fetches telemetry and builds the figure every POLL_SECONDS;
+# browser callbacks only read the latest result from STATE, so upstream API
+# load does not grow with the number of open tabs.
+def poll_once():
+    """Fetches new data, updates track, and publishes the map figure."""
+    data = get_iss_telemetry()
+    if data is None:
+        return
+
+    lat = float(data["latitude"])
+    lon = float(data["longitude"])
+    alt = float(data["altitude"])
+    vel = float(data["velocity"])
+    vis_code = VIS_CODE.get(data["visibility"], VIS_UNKNOWN)
+    current_time = time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime())
 
     # Country lookup
     country_name, country_color = "Ocean", "red"
     try:
-        coord_url = f"https://api.wheretheiss.at/v1/coordinates/{lat},{lon}"
-        resp2 = requests.get(coord_url, timeout=6)
-        resp2.raise_for_status()
-        cdata = resp2.json()
-        code = cdata.get("country_code")
+        code = reverse_geocode(lat, lon)
         if code and code != "??":
-            match = pycountry.countries.get(alpha_2=code.upper())
-            country_name = match.name if match else code
+            country_name = country_name_for(code.upper())
             country_color = "red"
     except requests.RequestException:
         pass # Silently fail on API or network errors
 
-    # Append into server-side deques (these enforce MAX_POINTS automatically)
-    # The initial check for track_data being None is no longer strictly needed 
-    # since the deques are global and the dcc.Store data is now only used 
-    # for return compatibility.
-    TRACK_LAT.append(lat)
-    TRACK_LON.append(lon)
-    TRACK_VIS.append(vis)
-
-    # Build the dataframe from the deques (already trimmed)
-    track_df = pd.DataFrame({
-        "lat": list(TRACK_LAT),
-        "lon": list(TRACK_LON),
-        "vis": list(TRACK_VIS)
-    })
-
-    # Prepare data for dcc.Store update
-    track_data = {"lat": list(TRACK_LAT), "lon": list(TRACK_LON), "vis": list(TRACK_VIS)}
-
-    fig = go.Figure()
-
-    # Main map track
-    for seg in split_segments(track_df):
-        vtype = seg["vis"].iloc[0]
-        if vtype in color_map:
-            fig.add_trace(go.Scattergeo(
-                lat=seg["lat"],
-                lon=seg["lon"],
-                mode="lines",
-                line=dict(width=2, color=color_map[vtype]),
-                showlegend=False,
-                geo="geo"
-            ))
-
-    # Current ISS marker (MAIN map) — synchronized color
-    current_color = color_map.get(vis, "#FFFFFF")
-    fig.add_trace(go.Scattergeo(
-        lat=[lat],
-        lon=[lon],
-        mode="text",
-        text=["🎅"],
-        textfont=dict(size=28),   # adjust size as needed
-        showlegend=False,
-        geo="geo"
-    ))
-
-    # Inset globe marker — uses the SAME color variable
-    fig.add_trace(go.Scattergeo(
-        lat=[lat],
-        lon=[lon],
-        mode="markers",
-        marker=dict(size=8, color=current_color),
-        showlegend=False,
-        geo="geo2"
-    ))
-
-    legend_html = (
-        "<b>Visibility</b><br>"
-        f"<span style='color:{color_map['daylight']}'>━━ ●</span> daylight<br>"
-        f"<span style='color:{color_map['visible']}'>━━ ●</span> visible<br>"
-        f"<span style='color:{color_map['eclipsed']}'>━━ ●</span> eclipsed"
-    )
+    # Append into the server-side ring buffers (capped at MAX_POINTS),
+    # which are the only copy of the track history.
+    trimmed, started = append_track_point(lat, lon, vis_code)
+    lats, lons = ordered_track(LAT_BUF), ordered_track(LON_BUF)
 
-    fig.update_layout(
-        images=[dict(
-            source=f"data:image/png;base64,{encoded_image}",
-            xref="paper", yref="paper",
-            x=-0.01, y=0.99,
-            sizex=0.50, sizey=0.50,
-            xanchor="left", yanchor="top",
-            layer="above"
-        )],
-        annotations=[
-            dict(text="<b>Currently over:</b>", x=-0.005, y=0.11,
-                 xref="paper", yref="paper", showarrow=False,
-                 font=dict(size=24, color="#00ff7f"),
-                 bgcolor="rgba(0,0,0,1)", borderpad=1),
-            dict(text=f"<b>{country_name}</b>", x=-0.005, y=0.01,
-                 xref="paper", yref="paper", showarrow=False,
-                 font=dict(size=30, color="red"),
-                 bgcolor="rgba(0,0,0,0)", borderpad=6),
-            dict(text=f"<b>{current_time}</b>", x=0.5, y=1.03,
-                 xref="paper", yref="paper", showarrow=False,
-                 font=dict(size=22, color="red")),
-            dict(text=legend_html, x=0.99, y=0.98,
-                 xref="paper", yref="paper", showarrow=False,
-                 align="left", font=dict(size=20, color="springgreen")),
-        ],
-        paper_bgcolor="rgba(0,0,0,0)",
-        plot_bgcolor="black",
-        margin=dict(l=30, r=30, t=40, b=30),
-        geo=dict(
-            domain=dict(x=[0.068,  0.932],  y=[0.068,  0.932]),
-            projection_type="natural earth",
-            showland=True, landcolor="#00ff7f",
-            showcountries=True, countrycolor="darkgreen",
-            showcoastlines=True, coastlinecolor="#00ff7f",
-            bgcolor="black", showframe=True, framecolor="#00ff7f",
-        ),
-        geo2=dict(
-            domain=dict(x=[0.79, 1.0], y=[0.04, 0.28]),
-            showland=True, landcolor="tan",
-            showcountries=False,
-            showcoastlines=True, coastlinecolor="tan",
-            projection_type="orthographic",
-            bgcolor='black',
-            showframe=False
-        )
-    )
+    # Main map track: copy the prebuilt segment traces with their slice of
+    # the ordered track instead of constructing Plotly objects every tick.
+    # Copies (not in-place updates) keep published figures unchanged while
+    # callbacks serialize them.
+    traces, start = [], 0
+    for _, count, trace in SEGMENTS:
+        end = start + count
+        if trace is not None:
+            traces.append(dict(trace, lat=lats[start:end], lon=lons[start:end]))
+        start = end
+
+    # Position markers on the main map and the inset globe
+    traces.append(dict(SANTA_MARKER, lat=[lat], lon=[lon]))
+    traces.append(dict(INSET_MARKER, lat=[lat], lon=[lon],
+                       marker=INSET_MARKER_STYLES[vis_code]))
+
+    # Only the country and timestamp annotations change between updates
+    annotations = list(BASE_LAYOUT["annotations"])
+    annotations[1] = dict(annotations[1], text=f"<b>{country_name}</b>")
+    annotations[2] = dict(annotations[2], text=f"<b>{current_time}</b>")
+    fig = dict(data=traces, layout=dict(BASE_LAYOUT, annotations=annotations))
+    patch = track_patch(trimmed, started, traces, annotations)
+
+    # Publish the values for the five figure and readout Outputs
+    outputs = (fig, f"{lat:.2f}", f"{lon:.2f}", f"{alt:.2f}", f"{vel:.2f}")
+    with STATE_LOCK:
+        STATE["seq"] += 1
+        STATE["outputs"] = outputs
+        STATE["patch"] = patch
+
+def poll_loop():
+    """Runs poll_once forever at the polling interval."""
+    # Sleep until a fixed deadline so request time does not stretch the
+    # period beyond the browser's interval; after an overrun, poll again
+    # right away rather than firing a burst of catch-up polls
+    deadline = time.monotonic()
+    while True:
+        try:
+            poll_once()
+        except Exception as e:  # Keep the poller alive on unexpected API data
+            print(f"⚠️ Poll failed: {e}")
+        deadline = max(deadline + POLL_SECONDS, time.monotonic())
+        time.sleep(max(0, deadline - time.monotonic()))
+
+# --- Callback for Updating Map and Readouts ---
+@app.callback(
+    [
+        Output("iss-map", "figure"),
+        Output("lat-box", "children"),
+        Output("lon-box", "children"),
+        Output("alt-box", "children"),
+        Output("vel-box", "children"),
+        Output("track-seq", "data"),
+    ],
+    Input("interval", "n_intervals"),
+    State("track-seq", "data")
+)
+def update_map(_, client_seq):
+    """Returns the latest figure and readouts published by the poller.
+
+    A browser exactly one tick behind gets only the patch for that tick;
+    new or lagging browsers (e.g. after a hidden tab) get the full figure.
+    """
+    with STATE_LOCK:
+        seq, outputs, patch = STATE["seq"], STATE["outputs"], STATE["patch"]
+    if outputs is None or client_seq == [BOOT_ID, seq]:
+        raise PreventUpdate
 
-    # Return values for the six Outputs
-    return (fig, f"{lat:.2f}", f"{lon:.2f}", f"{alt:.2f}",
-            f"{vel:.2f}", track_data)
+    fig, *readouts = outputs
+    if client_seq == [BOOT_ID, seq - 1]:
+        fig = patch
+    return (fig, *readouts, [BOOT_ID, seq])
 
 if __name__ == "__main__":
+    threading.Thread(target=poll_loop, daemon=True).start()
     # Standard way to run a Dash application from a command line
     app.run(host='0.0.0.0', debug=False)
\ No newline at end of file